@@ -0,0 +1,87 @@
+"""Optional Numba kernels for batch image statistics.
+
+Not used by the API. numba is not in requirements.txt; install
+requirements-numba.txt to use this module.
+"""
+
+from __future__ import annotations
+
+from typing import Tuple
+
+import numpy as np
+from numba import njit, prange
+
+# L1 Sobel magnitude above which a pixel counts as an edge (matches the upper
+# Canny threshold used in analysis.py).
+SOBEL_EDGE_THRESHOLD = 200
+
+
+@njit(inline="always")
+def _gray(img: np.ndarray, y: int, x: int) -> float:
+	# BT.601 luma, same weights as cv2.COLOR_BGR2GRAY
+	return 0.114 * img[y, x, 0] + 0.587 * img[y, x, 1] + 0.299 * img[y, x, 2]
+
+
+@njit(parallel=True, fastmath=True)
+def compute_features(img: np.ndarray) -> Tuple[float, float, float, float, float, float, float, float]:
+	"""Compute all per-image statistics in a single parallel pass over a BGR image.
+
+	Returns (mean_b, mean_g, mean_r, edge_ratio, brightness, saturation,
+	gray_mean, laplacian_variance). Edge and Laplacian statistics are taken
+	over interior pixels only.
+	"""
+	h, w = img.shape[0], img.shape[1]
+	sum_b = 0.0
+	sum_g = 0.0
+	sum_r = 0.0
+	sum_v = 0.0
+	sum_s = 0.0
+	sum_gray = 0.0
+	edges = 0
+	lap_sum = 0.0
+	lap_sq = 0.0
+	for y in prange(h):
+		for x in range(w):
+			b = img[y, x, 0]
+			g = img[y, x, 1]
+			r = img[y, x, 2]
+			sum_b += b
+			sum_g += g
+			sum_r += r
+			v = max(b, g, r)
+			sum_v += v
+			if v > 0:
+				sum_s += 255.0 * (v - min(b, g, r)) / v
+			center = _gray(img, y, x)
+			sum_gray += center
+
+			if 0 < y < h - 1 and 0 < x < w - 1:
+				tl = _gray(img, y - 1, x - 1)
+				tc = _gray(img, y - 1, x)
+				tr = _gray(img, y - 1, x + 1)
+				ml = _gray(img, y, x - 1)
+				mr = _gray(img, y, x + 1)
+				bl = _gray(img, y + 1, x - 1)
+				bc = _gray(img, y + 1, x)
+				br = _gray(img, y + 1, x + 1)
+				gx = (tr + 2.0 * mr + br) - (tl + 2.0 * ml + bl)
+				gy = (bl + 2.0 * bc + br) - (tl + 2.0 * tc + tr)
+				if abs(gx) + abs(gy) > SOBEL_EDGE_THRESHOLD:
+					edges += 1
+				lap = tc + ml + mr + bc - 4.0 * center
+				lap_sum += lap
+				lap_sq += lap * lap
+
+	n = float(h * w)
+	interior = float(max(1, (h - 2) * (w - 2)))
+	lap_mean = lap_sum / interior
+	return (
+		sum_b / n,
+		sum_g / n,
+		sum_r / n,
+		edges / interior,
+		sum_v / n,
+		sum_s / n,
+		sum_gray / n,
+		lap_sq / interior - lap_mean * lap_mean,
+	)
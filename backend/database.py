@@ -1,18 +1,44 @@
-from sqlmodel import SQLModel, create_engine, Session
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-# Use synchronous SQLite (no async needed)
+# Async SQLite via aiosqlite so queries never block the event loop
 # On Render, root directory is "backend", so just use ./influencers.db
-DATABASE_URL = "sqlite:///./influencers.db"
+DATABASE_URL = "sqlite+aiosqlite:///./influencers.db"
 
-engine = create_engine(DATABASE_URL, echo=False, connect_args={"check_same_thread": False})
+engine = create_async_engine(DATABASE_URL, echo=False)
 
 
-def init_db():
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Use WAL so readers don't block on writers, and relax fsyncs/caching."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA cache_size=-20000")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.close()
+
+
+def _create_schema(connection) -> None:
+    SQLModel.metadata.create_all(connection)
+    # create_all skips tables that already exist, so add any indexes that were
+    # introduced after an existing database file was created.
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+async def init_db():
     """Initialize database tables."""
-    SQLModel.metadata.create_all(engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(_create_schema)
 
 
-def get_session():
+async def get_session():
     """Dependency to get database session."""
-    with Session(engine) as session:
+    # Keep attributes loaded after commit; lazy refreshes can't run under asyncio
+    async with AsyncSession(engine, expire_on_commit=False) as session:
         yield session
@@ -1,16 +1,19 @@
 from __future__ import annotations
 
+import hashlib
 import io
 import os
 from pathlib import Path
 from typing import List
 from dotenv import load_dotenv
 
-import requests
+import httpx
 import asyncio
 from fastapi import FastAPI, Depends, HTTPException
 import traceback
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
@@ -19,18 +22,16 @@ load_dotenv()
 
 # Local imports (module run via `uvicorn main:app`)
 from database import get_session, init_db  # type: ignore
-from models import Influencer, Post, Reel  # type: ignore
+from models import FeatureCache, Influencer, Post, Reel  # type: ignore
 from schemas import InfluencerOut, PostOut, ReelOut  # type: ignore
-from analysis import (
-    extract_keywords_from_image,
-    classify_vibe_from_image,
-    quality_indicators,
-)  # type: ignore
+from analysis import analyze_image  # type: ignore
 from scraper import (
+    fetch_all,
     fetch_public_profile,
     fetch_instagram_posts_apify,
     fetch_instagram_profile_apify,
     fetch_instagram_profile_direct,
+    invalidate_profile,
 )  # type: ignore
 
 app = FastAPI(title="Influencer Analytics API")
@@ -72,30 +73,41 @@ else:
 
 
 @app.on_event("startup")
-def on_startup() -> None:
-	init_db()  # No await - it's synchronous now
+async def on_startup() -> None:
+	# Shared pooled client for outbound image fetches
+	app.state.http = httpx.AsyncClient(
+		http2=True,
+		timeout=10,
+		follow_redirects=True,
+		headers={"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"},
+	)
+	await init_db()
 	# Pre-seed demo data
 	session_gen = get_session()
-	session = next(session_gen)
+	session = await session_gen.__anext__()
 	try:
-		seed_sample_data(session)
+		await seed_sample_data(session)
 	finally:
 		try:
-			session.close()
+			await session_gen.aclose()
 		except Exception:
 			pass
 
 
-def seed_sample_data(session, username: str = "ralph") -> None:
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+	await app.state.http.aclose()
+
+
+async def seed_sample_data(session: AsyncSession, username: str = "ralph") -> None:
     """Seed sample posts/reels for a username where missing."""
-    # Get or create influencer synchronously
-    result = session.execute(select(Influencer).where(Influencer.username == username))
+    # Get or create influencer
+    result = await session.execute(select(Influencer).where(Influencer.username == username))
     inf = result.scalar_one_or_none()
     if not inf:
         inf = Influencer(name=username, username=username)
         session.add(inf)
-        session.commit()
-        session.refresh(inf)
+        await session.flush()
     placeholder_imgs = [
 			"https://images.unsplash.com/photo-1460353581641-37baddab0fa2?w=800",
 			"https://images.unsplash.com/photo-1507525428034-b723cf961d3e?w=800",
@@ -110,34 +122,36 @@ def seed_sample_data(session, username: str = "ralph") -> None:
         ]
 
     # Seed posts if none
-    posts = session.execute(select(Post).where(Post.influencer_id == inf.id)).scalars().all()
+    posts = (await session.execute(select(Post).where(Post.influencer_id == inf.id))).scalars().all()
     if not posts:
-        for i, url in enumerate(placeholder_imgs[:10]):
-            session.add(
-                Post(
-                    influencer_id=inf.id,
-                    image_url=url,
-                    caption=f"Sample post {i+1}",
-                    likes=1000 + i * 123,
-                    comments=50 + i * 7,
-                )
+        posts_to_add: list[Post] = [
+            Post(
+                influencer_id=inf.id,
+                image_url=url,
+                caption=f"Sample post {i+1}",
+                likes=1000 + i * 123,
+                comments=50 + i * 7,
             )
+            for i, url in enumerate(placeholder_imgs[:10])
+        ]
+        session.add_all(posts_to_add)
 
     # Seed reels if none
-    reels = session.execute(select(Reel).where(Reel.influencer_id == inf.id)).scalars().all()
+    reels = (await session.execute(select(Reel).where(Reel.influencer_id == inf.id))).scalars().all()
     if not reels:
-        for i, url in enumerate(placeholder_imgs[:5]):
-            session.add(
-                Reel(
-                    influencer_id=inf.id,
-                    thumbnail_url=url,
-                    caption=f"Sample reel {i+1}",
-                    views=10000 + i * 2500,
-                    likes=800 + i * 90,
-                    comments=40 + i * 6,
-                )
+        reels_to_add: list[Reel] = [
+            Reel(
+                influencer_id=inf.id,
+                thumbnail_url=url,
+                caption=f"Sample reel {i+1}",
+                views=10000 + i * 2500,
+                likes=800 + i * 90,
+                comments=40 + i * 6,
             )
-    session.commit()
+            for i, url in enumerate(placeholder_imgs[:5])
+        ]
+        session.add_all(reels_to_add)
+    await session.commit()
 
 
 
@@ -150,16 +164,18 @@ async def health() -> dict[str, str]:
 async def proxy_image(url: str):
 	"""Proxy Instagram images to bypass CORS restrictions."""
 	try:
-		from fastapi.responses import Response
-		response = requests.get(url, timeout=10, headers={
-			"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-		})
-		return Response(
-			content=response.content,
+		from fastapi.responses import StreamingResponse
+		from starlette.background import BackgroundTask
+		# Stream chunks through as they arrive instead of buffering the image
+		request = app.state.http.build_request("GET", url)
+		response = await app.state.http.send(request, stream=True)
+		return StreamingResponse(
+			response.aiter_bytes(),
 			media_type=response.headers.get("content-type", "image/jpeg"),
 			headers={
 				"Cache-Control": "public, max-age=86400",  # Cache for 1 day
-			}
+			},
+			background=BackgroundTask(response.aclose),
 		)
 	except Exception as e:
 		from fastapi.responses import JSONResponse
@@ -172,7 +188,7 @@ async def ensure_influencer(session: AsyncSession, username: str) -> Influencer:
 	if inf:
 		return inf
 	# Seed minimal data from scraper fallback
-	data = fetch_public_profile(username)
+	data = await asyncio.to_thread(fetch_public_profile, username)
 	if not data:
 		inf = Influencer(name=username, username=username)
 		session.add(inf)
@@ -195,22 +211,28 @@ async def ensure_influencer(session: AsyncSession, username: str) -> Influencer:
 	return inf
 
 
+def _split_csv(val: str | None) -> list[str] | None:
+    if not val:
+        return None
+    return [s for s in val.split(",") if s] or None
+
+
 @app.get("/influencers/{username}", response_model=InfluencerOut)
-def get_influencer(username: str, session = Depends(get_session)):
+async def get_influencer(username: str, session: AsyncSession = Depends(get_session)):
     try:
-        # Get or create influencer synchronously
-        result = session.execute(select(Influencer).where(Influencer.username == username))
+        # Get or create influencer
+        result = await session.execute(select(Influencer).where(Influencer.username == username))
         inf = result.scalar_one_or_none()
         if not inf:
             inf = Influencer(name=username, username=username)
             session.add(inf)
-            session.commit()
-            session.refresh(inf)
-        
-        session.refresh(inf)
-        # load posts and reels
-        posts = session.execute(select(Post).where(Post.influencer_id == inf.id).limit(10)).scalars().all()
-        reels = session.execute(select(Reel).where(Reel.influencer_id == inf.id).limit(5)).scalars().all()
+            await session.commit()
+            posts: list[Post] = []
+            reels: list[Reel] = []
+        else:
+            # Only the rows shown are loaded; an influencer can have many more
+            posts = (await session.execute(select(Post).where(Post.influencer_id == inf.id).limit(10))).scalars().all()
+            reels = (await session.execute(select(Reel).where(Reel.influencer_id == inf.id).limit(5))).scalars().all()
 
         # compute averages and engagement
         if posts:
@@ -220,13 +242,10 @@ def get_influencer(username: str, session = Depends(get_session)):
             inf.avg_comments = avg_comments
             if inf.followers:
                 inf.engagement_rate = (avg_likes + avg_comments) / max(1, inf.followers) * 100.0
-        session.commit()
-        session.refresh(inf)
+            if session.is_modified(inf):
+                await session.commit()
 
         # transform to schema lists
-        def split_csv(val: str | None) -> list[str] | None:
-            return [s for s in (val or "").split(",") if s] or None
-
         posts_out: List[PostOut] = [
             PostOut(
                 id=p.id,
@@ -235,7 +254,7 @@ def get_influencer(username: str, session = Depends(get_session)):
                 likes=p.likes,
                 comments=p.comments,
                 posted_at=p.posted_at,
-                keywords=split_csv(p.keywords),
+                keywords=_split_csv(p.keywords),
                 vibe=p.vibe,
                 quality=p.quality,
             )
@@ -251,7 +270,7 @@ def get_influencer(username: str, session = Depends(get_session)):
                 likes=r.likes,
                 comments=r.comments,
                 posted_at=r.posted_at,
-                tags=split_csv(r.tags),
+                tags=_split_csv(r.tags),
                 vibe=r.vibe,
             )
             for r in reels
@@ -277,13 +296,15 @@ def get_influencer(username: str, session = Depends(get_session)):
 
 
 @app.post("/analyze/post/{post_id}")
-def analyze_post(post_id: int, session = Depends(get_session)):
-	post = session.get(Post, post_id)
+async def analyze_post(post_id: int, session: AsyncSession = Depends(get_session)):
+	post = await session.get(Post, post_id)
 	if not post:
 		raise HTTPException(status_code=404, detail="Post not found")
+	if post.keywords is not None and post.vibe and post.quality:
+		return {"id": post.id, "keywords": post.keywords, "vibe": post.vibe, "quality": post.quality}
 	# fetch image bytes
 	try:
-		resp = requests.get(post.image_url, timeout=10)
+		resp = await app.state.http.get(post.image_url)
 		resp.raise_for_status()
 		image_bytes = resp.content
 	except Exception as e:
@@ -291,10 +312,28 @@ def analyze_post(post_id: int, session = Depends(get_session)):
 		raise HTTPException(status_code=500, detail=f"Failed to fetch image: {str(e)}")
 	
 	try:
-		post.keywords = ",".join(extract_keywords_from_image(image_bytes))
-		post.vibe = classify_vibe_from_image(image_bytes)
-		post.quality = quality_indicators(image_bytes)
-		session.commit()
+		# Identical images (reposts, shared CDN assets) are only analyzed once
+		key = hashlib.sha256(image_bytes).hexdigest()
+		cached = await session.get(FeatureCache, key)
+		if cached is None:
+			features = await asyncio.to_thread(analyze_image, image_bytes)
+			cached = FeatureCache(
+				key=key,
+				keywords=",".join(features["keywords"]),
+				vibe=features["vibe"],
+				quality=features["quality"],
+			)
+			# Concurrent requests for the same image may both miss; the
+			# result is deterministic, so whichever insert lands first wins.
+			await session.execute(
+				sqlite_insert(FeatureCache)
+				.values(key=cached.key, keywords=cached.keywords, vibe=cached.vibe, quality=cached.quality)
+				.on_conflict_do_nothing(index_elements=["key"])
+			)
+		post.keywords = cached.keywords
+		post.vibe = cached.vibe
+		post.quality = cached.quality
+		await session.commit()
 		return {"id": post.id, "keywords": post.keywords, "vibe": post.vibe, "quality": post.quality}
 	except Exception as e:
 		traceback.print_exc()
@@ -302,16 +341,15 @@ def analyze_post(post_id: int, session = Depends(get_session)):
 
 
 @app.post("/analyze/reel/{reel_id}")
-def analyze_reel(reel_id: int, session = Depends(get_session)):
+async def analyze_reel(reel_id: int, session: AsyncSession = Depends(get_session)):
     """Analyze a reel thumbnail (keywords/tags, vibe)."""
-    # Fetch reel synchronously
-    reel = session.get(Reel, reel_id)
+    reel = await session.get(Reel, reel_id)
     if not reel:
         raise HTTPException(status_code=404, detail="Reel not found")
 
     # fetch thumbnail bytes
     try:
-        resp = requests.get(reel.thumbnail_url, timeout=10)
+        resp = await app.state.http.get(reel.thumbnail_url)
         resp.raise_for_status()
         image_bytes = resp.content
     except Exception as e:
@@ -320,10 +358,10 @@ def analyze_reel(reel_id: int, session = Depends(get_session)):
 
     try:
         # Run analysis helpers (same as posts)
-        tags = extract_keywords_from_image(image_bytes)
-        reel.tags = ",".join(tags)
-        reel.vibe = classify_vibe_from_image(image_bytes)
-        session.commit()
+        features = await asyncio.to_thread(analyze_image, image_bytes)
+        reel.tags = ",".join(features["keywords"])
+        reel.vibe = features["vibe"]
+        await session.commit()
 
         return {"id": reel.id, "tags": reel.tags, "vibe": reel.vibe}
     except Exception as e:
@@ -347,8 +385,10 @@ async def fetch_from_apify(username: str, session: AsyncSession = Depends(get_se
     try:
         print(f"🔄 Fetching data from Apify for @{username}...")
         
-        # Fetch profile data from Apify
-        apify_data = fetch_public_profile(username)
+        # An explicit refresh must not be served the cached (or failed) lookup
+        invalidate_profile(username)
+        # Fetch profile data and recent posts from Apify concurrently
+        apify_data, apify_posts = await fetch_all(username, limit=20)
         
         if not apify_data:
             raise HTTPException(status_code=404, detail="Could not fetch data from Apify. Please check your APIFY_API_TOKEN in backend/.env")
@@ -380,22 +420,16 @@ async def fetch_from_apify(username: str, session: AsyncSession = Depends(get_se
             )
             session.add(inf)
         
-        await session.commit()
-        await session.refresh(inf)
+        # Flush (not commit) to get inf.id; everything below is one transaction
+        await session.flush()
         
         # Delete existing posts and reels for this influencer
-        existing_posts = (await session.execute(select(Post).where(Post.influencer_id == inf.id))).scalars().all()
-        for post in existing_posts:
-            await session.delete(post)
-        existing_reels = (await session.execute(select(Reel).where(Reel.influencer_id == inf.id))).scalars().all()
-        for reel in existing_reels:
-            await session.delete(reel)
+        await session.execute(delete(Post).where(Post.influencer_id == inf.id))
+        await session.execute(delete(Reel).where(Reel.influencer_id == inf.id))
         
-        # Fetch and store posts from Apify
-        apify_posts = fetch_instagram_posts_apify(username, limit=20)
-        
-        posts_added = 0
-        reels_added = 0
+        # Store posts fetched from Apify
+        posts_to_add: list[Post] = []
+        reels_to_add: list[Reel] = []
         for post_data in apify_posts:
             # Some Apify post items may be videos (reels) or images. Detect common
             # fields and save as Reel when appropriate.
@@ -423,8 +457,7 @@ async def fetch_from_apify(username: str, session: AsyncSession = Depends(get_se
                     comments=int(post_data.get("commentsCount", post_data.get("comments", 0)) or 0),
                     tags=",".join(post_data.get("tags", []) or []) if isinstance(post_data.get("tags"), list) else None,
                 )
-                session.add(reel)
-                reels_added += 1
+                reels_to_add.append(reel)
             else:
                 # Regular image post
                 post = Post(
@@ -434,8 +467,7 @@ async def fetch_from_apify(username: str, session: AsyncSession = Depends(get_se
                     likes=int(post_data.get("likesCount", 0)),
                     comments=int(post_data.get("commentsCount", 0)),
                 )
-                session.add(post)
-                posts_added += 1
+                posts_to_add.append(post)
         
         # Also check if profile has latestPosts
         if "latestPosts" in profile:
@@ -447,8 +479,7 @@ async def fetch_from_apify(username: str, session: AsyncSession = Depends(get_se
                     likes=int(post_data.get("likesCount", 0)),
                     comments=int(post_data.get("commentsCount", 0)),
                 )
-                session.add(post)
-                posts_added += 1
+                posts_to_add.append(post)
 
         # Try to extract reels from profile if present (actor variations exist)
         reels_source = profile.get("latestReels") or profile.get("latest_reels") or profile.get("latestReelsPosts") or profile.get("reels")
@@ -472,10 +503,13 @@ async def fetch_from_apify(username: str, session: AsyncSession = Depends(get_se
                     comments=comments,
                     tags=tags_csv,
                 )
-                session.add(reel)
-                reels_added += 1
-        
+                reels_to_add.append(reel)
+
+        session.add_all(posts_to_add)
+        session.add_all(reels_to_add)
         await session.commit()
+        posts_added = len(posts_to_add)
+        reels_added = len(reels_to_add)
         
         return {
             "status": "success",
@@ -502,7 +536,9 @@ async def _fetch_and_store_background(username: str) -> dict:
     session_gen = get_session()
     session: AsyncSession = await session_gen.__anext__()
     try:
-        apify_data = fetch_public_profile(username)
+        # An explicit refresh must not be served the cached (or failed) lookup
+        invalidate_profile(username)
+        apify_data = await asyncio.to_thread(fetch_public_profile, username)
         if not apify_data:
             return {"status": "no_data"}
 
@@ -533,12 +569,8 @@ async def _fetch_and_store_background(username: str) -> dict:
         await session.refresh(inf)
 
         # Delete existing posts and reels
-        existing_posts = (await session.execute(select(Post).where(Post.influencer_id == inf.id))).scalars().all()
-        for post in existing_posts:
-            await session.delete(post)
-        existing_reels = (await session.execute(select(Reel).where(Reel.influencer_id == inf.id))).scalars().all()
-        for reel in existing_reels:
-            await session.delete(reel)
+        await session.execute(delete(Post).where(Post.influencer_id == inf.id))
+        await session.execute(delete(Reel).where(Reel.influencer_id == inf.id))
 
         # Extract posts and reels from the profile payload where possible. This
         # avoids running a separate post-scraper actor and reduces total time.
@@ -585,7 +617,7 @@ async def _fetch_and_store_background(username: str) -> dict:
                     posts_added += 1
         else:
             # Fallback: call the post-scraper only if profile payload lacked posts
-            apify_posts = fetch_instagram_posts_apify(username, limit=30)
+            apify_posts = await asyncio.to_thread(fetch_instagram_posts_apify, username, 30)
             for post_data in apify_posts:
                 is_video = False
                 try:
@@ -688,7 +720,7 @@ async def debug_apify(username: str):
 
         # Run Apify fetch and capture exceptions/details
         try:
-            apify_payload = fetch_instagram_profile_apify(username)
+            apify_payload = await asyncio.to_thread(fetch_instagram_profile_apify, username)
             if apify_payload:
                 # if payload is a list of items, include count
                 if isinstance(apify_payload, list):
@@ -706,7 +738,7 @@ async def debug_apify(username: str):
             direct_payload = None
             # import here to avoid circulars
             from scraper import fetch_instagram_profile_direct  # type: ignore
-            direct_payload = fetch_instagram_profile_direct(username)
+            direct_payload = await asyncio.to_thread(fetch_instagram_profile_direct, username)
             if direct_payload:
                 diagnostics["direct"] = {"status": "ok", "keys": list(direct_payload.keys())}
                 diagnostics["direct_payload_preview"] = direct_payload if (isinstance(direct_payload, dict) and len(str(direct_payload)) < 2000) else None
@@ -7,7 +7,7 @@ from sqlmodel import SQLModel, Field, Relationship
 class Influencer(SQLModel, table=True):
 	id: Optional[int] = Field(default=None, primary_key=True)
 	name: str
-	username: str
+	username: str = Field(index=True)
 	profile_picture_url: Optional[str] = None
 	followers: int = 0
 	following: int = 0
@@ -23,7 +23,7 @@ class Influencer(SQLModel, table=True):
 
 class Post(SQLModel, table=True):
 	id: Optional[int] = Field(default=None, primary_key=True)
-	influencer_id: int = Field(foreign_key="influencer.id")
+	influencer_id: int = Field(foreign_key="influencer.id", index=True)
 	image_url: str
 	caption: Optional[str] = None
 	likes: int = 0
@@ -38,7 +38,7 @@ class Post(SQLModel, table=True):
 
 class Reel(SQLModel, table=True):
 	id: Optional[int] = Field(default=None, primary_key=True)
-	influencer_id: int = Field(foreign_key="influencer.id")
+	influencer_id: int = Field(foreign_key="influencer.id", index=True)
 	thumbnail_url: str
 	caption: Optional[str] = None
 	views: int = 0
@@ -51,3 +51,9 @@ class Reel(SQLModel, table=True):
 	influencer: "Influencer" = Relationship(back_populates="reels")
 
 
+class FeatureCache(SQLModel, table=True):
+	"""Image analysis results keyed by the SHA-256 of the image bytes."""
+	key: str = Field(primary_key=True)
+	keywords: str = ""  # comma-separated
+	vibe: str
+	quality: str
@@ -1,32 +1,133 @@
 from __future__ import annotations
 
+import asyncio
 import json
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+import logging
 import os
+from functools import cache, lru_cache
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, AsyncIterator, Dict, List, Tuple
+import aiohttp
 from apify_client import ApifyClient
-import re
-from requests import RequestException
+import tempfile
+import threading
+import time
+from cachetools import TTLCache
 import requests
+from requests.exceptions import RequestException
+from selectolax.parser import HTMLParser
 
+try:
+	import orjson
 
+	_loads = orjson.loads
+
+	def _dumps(obj: Any) -> bytes:
+		return orjson.dumps(obj, default=str)
+except ImportError:
+	_loads = json.loads
+
+	def _dumps(obj: Any) -> bytes:
+		return json.dumps(obj, default=str).encode("utf-8")
+
+logger = logging.getLogger(__name__)
+
+# Read once at import (main.py loads .env before importing this module)
+_APIFY_DEBUG = bool(os.getenv("APIFY_DEBUG"))
+
+# Successful profile lookups, keyed by lowercase username
+_PROFILE_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=300)
+# Usernames whose live lookups all failed recently (missing/private accounts),
+# so front-end retries don't each trigger a full Apify run and direct scrape
+_NEGATIVE_CACHE: TTLCache = TTLCache(maxsize=4096, ttl=30)
+_PROFILE_CACHE_LOCK = threading.Lock()
+
+
+@cache
 def get_apify_token() -> str:
-	"""Get Apify API token from environment variable."""
+	"""Get Apify API token from environment variable (read once per process)."""
 	return os.getenv("APIFY_API_TOKEN", "")
 
 
-def fetch_instagram_profile_apify(username: str) -> Dict[str, Any]:
+def _dump_jsonl(username: str, items: List[Any]) -> None:
+	"""Write one JSON document per line to <tmp>/apify-<username>-<ts>.jsonl."""
+	path = Path(tempfile.gettempdir()) / f"apify-{username}-{int(time.time())}.jsonl"
+	try:
+		with path.open("wb") as fh:
+			for item in items:
+				fh.write(_dumps(item))
+				fh.write(b"\n")
+		logger.info("Apify payload written to %s", path)
+	except Exception:
+		pass
+
+
+@lru_cache(maxsize=4)
+def _apify_client(token: str) -> ApifyClient:
+	"""Shared client per token so its HTTP connection pool is reused across calls."""
+	return ApifyClient(token)
+
+
+async def iter_items_prefetch(
+	client: ApifyClient, dataset_id: str, page_size: int = 100, limit: int | None = None
+) -> AsyncIterator[Dict[str, Any]]:
+	"""Yield dataset items while the next page is fetched in the background.
+
+	apify-client is synchronous, so each page request runs in a worker thread
+	and fills a bounded queue; the caller processes the current page while the
+	following one is in flight. Sync code (e.g. the fetchers below, which run
+	in worker threads themselves) should keep using iterate_items().
 	"""
-	Fetch Instagram profile data using Apify Instagram Profile Scraper.
-	Returns profile data with posts and reels.
+	dataset = client.dataset(dataset_id)
+	queue: asyncio.Queue = asyncio.Queue(maxsize=page_size)
+	done = object()
+
+	async def _producer() -> None:
+		offset = 0
+		try:
+			while limit is None or offset < limit:
+				count = page_size if limit is None else min(page_size, limit - offset)
+				page = await asyncio.to_thread(dataset.list_items, offset=offset, limit=count, clean=True)
+				for item in page.items:
+					await queue.put(item)
+				offset += len(page.items)
+				if len(page.items) < count:
+					break
+			await queue.put(done)
+		except Exception as e:
+			await queue.put(e)
+
+	producer = asyncio.create_task(_producer())
+	try:
+		while (item := await queue.get()) is not done:
+			if isinstance(item, Exception):
+				raise item
+			yield item
+	finally:
+		producer.cancel()
+
+
+def _item_username(item: Dict[str, Any]) -> str | None:
+	uname = item.get("username") or (item.get("user") or {}).get("username")
+	return uname.lower() if uname else None
+
+
+def fetch_instagram_profiles_apify(usernames: List[str]) -> Dict[str, Dict[str, Any]]:
+	"""
+	Fetch several Instagram profiles with one Apify Instagram Profile Scraper run.
+	Returns profile data (with posts and reels) keyed by lowercase username;
+	usernames without a result are left out.
 	"""
+	if not usernames:
+		return {}
 	token = get_apify_token()
 	if not token:
-		print("⚠️  APIFY_API_TOKEN not set, using fallback sample data")
+		logger.warning("APIFY_API_TOKEN not set, using fallback sample data")
 		return {}
 	
 	try:
-		client = ApifyClient(token)
+		client = _apify_client(token)
 		
 		# Run the Instagram Profile Scraper actor
 		# Actor ID: apify/instagram-profile-scraper
@@ -34,54 +135,65 @@ def fetch_instagram_profile_apify(username: str) -> Dict[str, Any]:
 		# support the `scrapeReels` flag — enabling it increases the chance
 		# that reel items are returned in the dataset.
 		run_input = {
-			"usernames": [username],
+			"usernames": list(usernames),
 			"resultsLimit": 50,  # Get up to 50 posts
 			"scrapeReels": True,
 		}
 		
-		print(f"🔄 Fetching Instagram data for @{username} via Apify...")
+		logger.info("Fetching Instagram data for %s via Apify", ", ".join(f"@{u}" for u in usernames))
 		run = client.actor("apify/instagram-profile-scraper").call(run_input=run_input)
 		
 		# Fetch results from the actor's dataset
-		results = []
-		for item in client.dataset(run["defaultDatasetId"]).iterate_items():
-			results.append(item)
-
-		if results:
-			print(f"✅ Successfully fetched {len(results)} items from Apify")
-
-			# If debug is enabled, dump the full payload to stdout for inspection
-			if os.getenv("APIFY_DEBUG"):
-				try:
-					print("--- APIFY PROFILE PAYLOAD DUMP START ---")
-					print(json.dumps(results, indent=2, default=str))
-					print("--- APIFY PROFILE PAYLOAD DUMP END ---")
-				except Exception:
-					pass
-
-			# Try to pick the item that looks like the requested profile
-			for item in results:
+		results = list(client.dataset(run["defaultDatasetId"]).iterate_items(clean=True))
+
+		if not results:
+			logger.warning("No results from Apify, using fallback")
+			return {}
+
+		logger.info("Fetched %d items from Apify", len(results))
+
+		# If debug is enabled, dump the full payload to a file for inspection
+		if _APIFY_DEBUG:
+			_dump_jsonl(usernames[0] if len(usernames) == 1 else f"batch{len(usernames)}", results)
+
+		if len(usernames) == 1:
+			# Every item of a single-profile run is about that profile: pick the
+			# first one that looks like it, falling back to the first item
+			target = usernames[0].lower()
+
+			def _matches(item: Any) -> bool:
+				if not isinstance(item, dict):
+					return False
 				# Some Apify actor outputs include a username or latestPosts/latestReels
-				uname = None
-				if isinstance(item, dict):
-					uname = item.get("username") or (item.get("user") or {}).get("username")
-					if uname and uname.lower() == username.lower():
-						return item
-					# If the item contains aggregated fields like latestPosts or latestReels, prefer it
-					if "latestPosts" in item or "latestReels" in item or "latest_posts" in item:
-						return item
-
-			# Fallback to first item if no better match
-			return results[0]
-		
-		print("⚠️  No results from Apify, using fallback")
-		return {}
+				if _item_username(item) == target:
+					return True
+				# If the item contains aggregated fields like latestPosts or latestReels, prefer it
+				return "latestPosts" in item or "latestReels" in item or "latest_posts" in item
+
+			return {target: next((item for item in results if _matches(item)), results[0])}
+
+		requested = {u.lower() for u in usernames}
+		profiles: Dict[str, Dict[str, Any]] = {}
+		for item in results:
+			if isinstance(item, dict):
+				uname = _item_username(item)
+				if uname in requested:
+					profiles.setdefault(uname, item)
+		return profiles
 		
 	except Exception as e:
-		print(f"❌ Error fetching from Apify: {e}")
+		logger.error("Error fetching from Apify: %s", e)
 		return {}
 
 
+def fetch_instagram_profile_apify(username: str) -> Dict[str, Any]:
+	"""
+	Fetch Instagram profile data using Apify Instagram Profile Scraper.
+	Returns profile data with posts and reels.
+	"""
+	return fetch_instagram_profiles_apify([username]).get(username.lower(), {})
+
+
 def fetch_instagram_posts_apify(username: str, limit: int = 20) -> List[Dict[str, Any]]:
 	"""
 	Fetch Instagram posts using Apify Instagram Post Scraper.
@@ -91,7 +203,7 @@ def fetch_instagram_posts_apify(username: str, limit: int = 20) -> List[Dict[str
 		return []
 	
 	try:
-		client = ApifyClient(token)
+		client = _apify_client(token)
 		
 		# Run the Instagram Post Scraper actor
 		run_input = {
@@ -99,101 +211,315 @@ def fetch_instagram_posts_apify(username: str, limit: int = 20) -> List[Dict[str
 			"resultsLimit": limit,
 		}
 		
-		print(f"🔄 Fetching posts for @{username}...")
+		logger.info("Fetching posts for @%s", username)
 		run = client.actor("apify/instagram-post-scraper").call(run_input=run_input)
 		
-		posts = []
-		for item in client.dataset(run["defaultDatasetId"]).iterate_items():
-			posts.append(item)
+		# Let the API enforce the cap and drop empty/hidden items server-side
+		posts = list(client.dataset(run["defaultDatasetId"]).iterate_items(clean=True, limit=limit))
 		
-		print(f"✅ Fetched {len(posts)} posts")
+		logger.info("Fetched %d posts", len(posts))
 		return posts
 		
 	except Exception as e:
-		print(f"❌ Error fetching posts: {e}")
+		logger.error("Error fetching posts: %s", e)
 		return []
 
 
+async def fetch_all(username: str, limit: int = 20) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+	"""Fetch the profile and its recent posts concurrently.
+
+	Both Apify actors are blocking, so each runs in a worker thread and the
+	total wait is the slower of the two rather than their sum.
+	"""
+	profile, posts = await asyncio.gather(
+		asyncio.to_thread(fetch_public_profile, username),
+		asyncio.to_thread(fetch_instagram_posts_apify, username, limit),
+	)
+	return profile, posts
+
+
+def fetch_all_sync(username: str, limit: int = 20) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+	"""Blocking wrapper around :func:`fetch_all` for code without an event loop."""
+	return asyncio.run(fetch_all(username, limit))
+
+
+@lru_cache(maxsize=1)
+def _sample_data() -> Dict[str, Any]:
+	"""Bundled sample profile, read and parsed once per process."""
+	sample_path = Path(__file__).with_name("sample_data.json")
+	if sample_path.exists():
+		return _loads(sample_path.read_bytes())
+	return {}
+
+
+def invalidate_profile(username: str) -> None:
+	"""Drop any cached profile (or cached failure) for ``username``."""
+	with _PROFILE_CACHE_LOCK:
+		_PROFILE_CACHE.pop(username.lower(), None)
+		_NEGATIVE_CACHE.pop(username.lower(), None)
+
+
+# Blocking lookups run here so sync callers don't tie up their own worker for
+# the full Apify/Instagram timeout chain.
+_POOL = ThreadPoolExecutor(max_workers=32, thread_name_prefix="ig-scrape")
+# URL probes get their own pool: submitting them into _POOL from a job already
+# running on _POOL could deadlock once every worker is busy with a lookup.
+_PROBE_POOL = ThreadPoolExecutor(max_workers=32, thread_name_prefix="ig-probe")
+
+
+def fetch_public_profile_future(username: str) -> Future:
+	"""Run :func:`fetch_public_profile` on the shared scrape pool."""
+	return _POOL.submit(fetch_public_profile, username)
+
+
 def fetch_public_profile(username: str) -> Dict[str, Any]:
 	"""
 	Fetch Instagram profile data.
 	Priority: 1) Apify API, 2) Direct scraping, 3) Sample data fallback
+	Live results are cached for 5 minutes; the sample fallback is not cached,
+	but a failed live lookup is remembered for 30 seconds.
 	"""
-	# Try Apify first
-	apify_data = fetch_instagram_profile_apify(username)
-	if apify_data:
-		return apify_data
+	key = username.lower()
+	with _PROFILE_CACHE_LOCK:
+		cached = _PROFILE_CACHE.get(key)
+		recently_failed = key in _NEGATIVE_CACHE
+	if cached is not None:
+		return cached
+	if recently_failed:
+		logger.debug("Live lookup for @%s failed recently, skipping to sample data", username)
+		return dict(_sample_data())
+
+	# Try Apify first (skipped entirely when no token is configured)
+	if get_apify_token():
+		apify_data = fetch_instagram_profile_apify(username)
+		if apify_data:
+			with _PROFILE_CACHE_LOCK:
+				_PROFILE_CACHE[key] = apify_data
+			return apify_data
 
 	# Try a direct public Instagram request (works often for public profiles)
 	direct = fetch_instagram_profile_direct(username)
 	if direct:
+		with _PROFILE_CACHE_LOCK:
+			_PROFILE_CACHE[key] = direct
 		return direct
 
+	with _PROFILE_CACHE_LOCK:
+		_NEGATIVE_CACHE[key] = True
+
 	# Fallback to bundled sample
-	print("⚠️  Using sample data fallback")
-	sample_path = Path(__file__).with_name("sample_data.json")
-	if sample_path.exists():
-		return json.loads(sample_path.read_text(encoding="utf-8"))
+	logger.warning("Using sample data fallback")
+	return dict(_sample_data())
+
+
+_UA_HEADERS = {
+	"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+	"Accept": "text/html,application/json,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+}
+
+
+# Shared session so keep-alive connections are reused between URL attempts
+_SESSION = requests.Session()
+
+# A 404 for the profile page means the profile does not exist, so no other
+# variant will succeed. The ?__a=1 endpoints don't reflect the profile's real
+# state (they answer 401 or 404 even for public profiles), so their errors
+# never end the lookup.
+_PROFILE_GONE_STATUSES = (404,)
+
+
+# Bodies are streamed and reading stops once the embedded-JSON script has
+# closed (or at the size cap), instead of buffering the whole page.
+_MAX_BODY_BYTES = 4 << 20
+_CHUNK_SIZE = 65536
+_PAYLOAD_MARKERS = (b'id="__NEXT_DATA__"', b"window._sharedData")
+
+
+class _BodyCollector:
+	"""Accumulate response chunks until the profile JSON has been received."""
+
+	def __init__(self) -> None:
+		self.data = bytearray()
+		self._marker_at = -1
+
+	def feed(self, chunk: bytes) -> bool:
+		"""Append ``chunk``; returns True when there is no need to read further."""
+		# Re-scan a little of the previous chunk in case a marker was split
+		scan_from = max(0, len(self.data) - 32)
+		self.data.extend(chunk)
+		if self._marker_at == -1:
+			for marker in _PAYLOAD_MARKERS:
+				pos = self.data.find(marker, scan_from)
+				if pos != -1:
+					self._marker_at = pos
+					break
+		if self._marker_at != -1 and self.data.find(b"</script>", max(self._marker_at, scan_from)) != -1:
+			return True
+		return len(self.data) > _MAX_BODY_BYTES
+
+
+# The HTML page is the variant most likely to work for public profiles;
+# the ?__a=1 endpoints mostly redirect to the login page nowadays.
+_URL_TEMPLATES = (
+	"https://www.instagram.com/%s/",
+	"https://www.instagram.com/%s/?__a=1&__d=dis",
+	"https://www.instagram.com/%s/?__a=1",
+)
+
+
+def _direct_profile_urls(username: str) -> List[str]:
+	# The first URL is always the profile page; see _PROFILE_GONE_STATUSES
+	return [t % username for t in _URL_TEMPLATES]
+
+
+_SHARED_DATA_PREFIX = "window._sharedData"
+_JSON_DECODER = json.JSONDecoder()
+
+
+def _parse_profile_payload(ctype: str, body: bytes) -> Dict[str, Any]:
+	"""Extract profile JSON from a direct Instagram response body, or {}."""
+	# If Content-Type indicates JSON, parse directly
+	if "application/json" in ctype:
+		try:
+			return _loads(body)
+		except Exception:
+			return {}
+
+	tree = HTMLParser(body)
+
+	# Try to find <script>window._sharedData = {...};</script>; raw_decode
+	# parses from the opening brace and stops at its matching close
+	for node in tree.css("script"):
+		text = node.text()
+		if text.lstrip().startswith(_SHARED_DATA_PREFIX):
+			brace = text.find("{")
+			if brace == -1:
+				return {}
+			try:
+				payload, _ = _JSON_DECODER.raw_decode(text, brace)
+				return payload
+			except ValueError:
+				return {}
+
+	# Some newer pages embed a JSON in <script id="__NEXT_DATA__"> ... </script>
+	node = tree.css_first("script#__NEXT_DATA__")
+	if node is not None:
+		try:
+			return _loads(node.text())
+		except ValueError:
+			return {}
+	return {}
+
+
+async def _try_direct_url(
+	session: aiohttp.ClientSession, url: str, profile_page: bool = False
+) -> Dict[str, Any] | None:
+	"""Fetch one URL variant; returns None if the profile definitely doesn't exist.
+
+	Only the profile page (``profile_page=True``) can report that.
+	"""
+	try:
+		logger.debug("Trying direct fetch from Instagram: %s", url)
+		async with session.get(url, headers=_UA_HEADERS, timeout=aiohttp.ClientTimeout(total=10)) as resp:
+			if profile_page and resp.status in _PROFILE_GONE_STATUSES:
+				return None
+			if resp.status != 200:
+				return {}
+			body = _BodyCollector()
+			async for chunk in resp.content.iter_chunked(_CHUNK_SIZE):
+				if body.feed(chunk):
+					break
+			return _parse_profile_payload(resp.headers.get("content-type", ""), bytes(body.data))
+	except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+		logger.warning("Direct fetch error for %s: %s", url, e)
+		return {}
+
+
+async def fetch_instagram_profile_direct_async(
+	username: str, session: aiohttp.ClientSession | None = None
+) -> Dict[str, Any]:
+	"""Race all direct Instagram URL variants and return the first usable payload.
+
+	Pass a long-lived ``session`` to reuse its connection pool across calls;
+	otherwise a session is opened for this lookup only.
+	"""
+	if session is None:
+		async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=10)) as own_session:
+			return await fetch_instagram_profile_direct_async(username, own_session)
+
+	tasks = [
+		asyncio.create_task(_try_direct_url(session, url, profile_page=(i == 0)))
+		for i, url in enumerate(_direct_profile_urls(username))
+	]
+	try:
+		for fut in asyncio.as_completed(tasks):
+			payload = await fut
+			if payload is None:
+				return {}
+			if payload:
+				return payload
+	finally:
+		for task in tasks:
+			task.cancel()
+		# Let the losers unwind (and release their connections) before the
+		# caller's session can be closed
+		await asyncio.gather(*tasks, return_exceptions=True)
 	return {}
 
 
 def fetch_instagram_profile_direct(username: str) -> Dict[str, Any]:
 	"""Attempt to fetch Instagram profile data directly from instagram.com.
 
-	Tries the documented JSON endpoints, then falls back to HTML parsing of
-	embedded JSON. Returns dict on success or {} on failure.
+	Tries the profile page (parsing its embedded JSON) and the documented
+	JSON endpoints. Returns dict on success or {} on failure, and gives up
+	early once Instagram reports the profile does not exist.
+
+	The URL variants are requested concurrently. When called from a thread
+	that is already running an event loop, they are probed with requests on a
+	thread pool instead; async code should await
+	:func:`fetch_instagram_profile_direct_async`.
 	"""
-	headers = {
-		"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-		"Accept": "text/html,application/json,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-	}
-
-	urls = [
-		f"https://www.instagram.com/{username}/?__a=1&__d=dis",
-		f"https://www.instagram.com/{username}/?__a=1",
-		f"https://www.instagram.com/{username}/",
-	]
+	try:
+		asyncio.get_running_loop()
+	except RuntimeError:
+		return asyncio.run(fetch_instagram_profile_direct_async(username))
+	return _fetch_instagram_profile_direct_sync(username)
 
-	for url in urls:
-		try:
-			print(f"🔎 Trying direct fetch from Instagram: {url}")
-			resp = requests.get(url, headers=headers, timeout=10)
+
+def _try_direct_url_sync(url: str, profile_page: bool = False) -> Dict[str, Any] | None:
+	"""Fetch one URL variant with requests; see :func:`_try_direct_url`."""
+	try:
+		logger.debug("Trying direct fetch from Instagram: %s", url)
+		with _SESSION.get(url, headers=_UA_HEADERS, timeout=10, stream=True) as resp:
+			if profile_page and resp.status_code in _PROFILE_GONE_STATUSES:
+				return None
 			if resp.status_code != 200:
-				# continue to next attempt
-				continue
-
-			# If Content-Type indicates JSON, parse directly
-			ctype = resp.headers.get("content-type", "")
-			if "application/json" in ctype:
-				try:
-					return resp.json()
-				except Exception:
-					continue
-
-			text = resp.text
-			# Try to find window._sharedData or similar embedded JSON
-			m = re.search(r"window\._sharedData\s*=\s*({.+?});</script>", text, flags=re.S)
-			if not m:
-				# Try a looser regex for "<script type=\"text/javascript\">window._sharedData = {...}</script>"
-				m = re.search(r"window\._sharedData\s*=\s*({.+?})\s*;", text, flags=re.S)
-			if m:
-				try:
-					payload = json.loads(m.group(1))
-					return payload
-				except Exception:
-					continue
-
-			# Some newer pages embed a JSON in <script id="__NEXT_DATA__"> ... </script>
-			m2 = re.search(r"<script id=\"__NEXT_DATA__\" type=\"application/json\">(.*?)</script>", text, flags=re.S)
-			if m2:
-				try:
-					return json.loads(m2.group(1))
-				except Exception:
-					continue
-
-		except RequestException as e:
-			# network error, try next URL
-			print(f"⚠️ direct fetch error for {url}: {e}")
-			continue
+				# rate limited, server error, etc.: let the other attempts decide
+				return {}
+			body = _BodyCollector()
+			for chunk in resp.iter_content(_CHUNK_SIZE):
+				if body.feed(chunk):
+					break
+			return _parse_profile_payload(resp.headers.get("content-type", ""), bytes(body.data))
+	except RequestException as e:
+		# network error, the other URLs may still work
+		logger.warning("Direct fetch error for %s: %s", url, e)
+		return {}
 
+
+def _fetch_instagram_profile_direct_sync(username: str) -> Dict[str, Any]:
+	futures = [
+		_PROBE_POOL.submit(_try_direct_url_sync, url, i == 0)
+		for i, url in enumerate(_direct_profile_urls(username))
+	]
+	try:
+		for future in as_completed(futures):
+			payload = future.result()
+			if payload is None:
+				return {}
+			if payload:
+				return payload
+	finally:
+		for future in futures:
+			future.cancel()
 	return {}